@@ -1,14 +1,14 @@
 #!/usr/bin/env python
 
+import io
+import json
 import os
-import re
 import requests
-import textwrap
 import logging
 import xml.etree.ElementTree as ET
-from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor
 
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,6 +17,10 @@ logger = logging.getLogger(__name__)
 RSS_FEED_URL = "https://thisweek.gnome.org/index.xml"
 TELEGRAM_API_BASE = "https://api.telegram.org/bot"
 MAX_IMAGES_PER_MESSAGE = 10 # Telegram allows a max of 10 images per call
+MAX_CAPTION_LENGTH = 1024 # Telegram limit for media captions
+MAX_IMAGE_BYTES = 10_000_000 # Telegram rejects photos larger than this
+STATE_FILE = os.path.expanduser("~/.cache/twig-bot/state.json")
+REQUEST_TIMEOUT = (3.05, 15) # connect, read (seconds)
 
 # Environment variables (required)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -25,12 +29,63 @@ CHAT_ID = os.getenv("CHAT_ID")
 if not BOT_TOKEN or not CHAT_ID:
     raise EnvironmentError("Please set BOT_TOKEN and CHAT_ID environment variables.")
 
+# Shared session so connections to the feed, CDN and Telegram hosts are
+# pooled and TLS handshakes are not repeated on every call
+SESSION = requests.Session()
+SESSION.headers.update({
+    "User-Agent": "twig-telegram-bot",
+    "Accept-Encoding": "gzip",
+})
+# Retry transient failures with backoff; Retry-After on 429s is honored
+_retry = requests.adapters.Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET", "POST", "HEAD"]),
+)
+_adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_retry)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+
+def load_state() -> dict:
+    """Read the state persisted by a previous run, if any."""
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict) -> None:
+    """Persist state for the next run."""
+    try:
+        os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+        with open(STATE_FILE, "w") as f:
+            json.dump(state, f)
+    except OSError as e:
+        logger.warning(f"Error saving state file: {e}")
+
+
+def fetch_rss_content(url: str, state: dict) -> str:
+    """Fetch the XML content of the RSS feed, skipping unchanged feeds."""
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
 
-def fetch_rss_content(url: str) -> str:
-    """Fetch the XML content of the RSS feed."""
     try:
-        response = requests.get(url)
+        response = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            logger.info("RSS feed not modified since last run.")
+            return None
         response.raise_for_status()
+        # Only stash the validators here; main() persists them together
+        # with last_url after a successful send, so a failed run still
+        # refetches and retries the post next time
+        state["etag"] = response.headers.get("ETag")
+        state["last_modified"] = response.headers.get("Last-Modified")
         return response.content
     except requests.RequestException as e:
         logger.error(f"Error fetching RSS feed: {e}")
@@ -40,78 +95,150 @@ def fetch_rss_content(url: str) -> str:
 def get_latest_post_url(xml_content: str) -> str:
     """Extract the first post URL from the RSS feed."""
     try:
-        root = ET.fromstring(xml_content)
-        item = root.find(".//item/link")
-        return item.text if item is not None else None
+        # Stream the feed and stop at the first item's <link>, instead of
+        # building a tree for every historical item
+        in_item = False
+        for event, elem in ET.iterparse(io.BytesIO(xml_content), events=("start", "end")):
+            if event == "start":
+                if elem.tag == "item":
+                    in_item = True
+            elif in_item and elem.tag == "link":
+                return elem.text
+            elif elem.tag == "item":
+                # RSS structure is fixed: later items are only older posts,
+                # so a first item without a link means there is no URL
+                break
+            else:
+                elem.clear()
+        return None
     except ET.ParseError as e:
         logger.error(f"Error parsing XML: {e}")
         return None
 
 
-def fetch_post_content(url: str) -> BeautifulSoup:
+def fetch_post_content(url: str) -> LexborHTMLParser:
     """Fetch and parse the post's HTML content."""
     try:
-        response = requests.get(url)
+        response = SESSION.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        return BeautifulSoup(response.content, "html.parser")
+        return LexborHTMLParser(response.content)
     except requests.RequestException as e:
         logger.error(f"Error fetching post content: {e}")
         return None
 
 
-def extract_post_data(soup: BeautifulSoup, post_url: str) -> tuple:
+def extract_post_data(tree: LexborHTMLParser, post_url: str) -> tuple:
     """Extract the post title and image URLs."""
-    post_title_data = soup.select_one("body > main > div.post > h1.post-title")
-    post_title = post_title_data.text if post_title_data else "Untitled Post"
-    img_tags = soup.select("body > main > div.post > blockquote > p > img")
-    image_urls = [requests.compat.urljoin(post_url, img.get('src')) for img in img_tags if img.get('src')]
-    return post_title, image_urls
+    post_title_data = tree.css_first("body > main > div.post > h1.post-title")
+    post_title = post_title_data.text() if post_title_data else "Untitled Post"
+    img_tags = tree.css("body > main > div.post > blockquote > p > img[src]")
+    image_urls = [requests.compat.urljoin(post_url, src) for img in img_tags if (src := img.attributes.get('src'))]
+    # Some posts repeat the same image; keep one URL each, preserving order
+    return post_title, tuple(dict.fromkeys(image_urls))
+
+
+# Telegram MarkdownV2 special characters, each mapped to its escaped form
+_MDV2_TABLE = {ord(c): '\\' + c for c in '_*[]()~`>#+-=|{}.!'}
 
 
 def escape_markdown_v2(text: str) -> str:
     """Escape special characters for MarkdownV2."""
-    special_chars = r'_\*[]()~`>#+-=|{}.!'
-    return re.sub(f'([{re.escape(special_chars)}])', r'\\\1', text)
+    return text.translate(_MDV2_TABLE)
+
+
+# The fixed part of the caption never changes, so escape it once at import
+_CAPTION_SUFFIX = escape_markdown_v2(" - Essa Semana no GNOME\n")
 
 
 def prepare_caption(title: str, url: str) -> str:
     """Get the pieces together to format the text to be sent."""
-    return escape_markdown_v2(f"{title} - Essa Semana no GNOME\n{url}")
+    return escape_markdown_v2(title) + _CAPTION_SUFFIX + escape_markdown_v2(url)
+
+
+def validate_image_urls(image_urls) -> list:
+    """Drop image URLs Telegram would reject, checking them in parallel."""
+    def check(url):
+        try:
+            response = SESSION.head(url, allow_redirects=True, timeout=5)
+        except requests.RequestException as e:
+            logger.warning(f"Error checking image {url}: {e}")
+            return None
+        if response.status_code >= 400:
+            logger.warning(f"Skipping image {url}: HTTP {response.status_code}")
+            return None
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > MAX_IMAGE_BYTES:
+            logger.warning(f"Skipping image {url}: {length} bytes is over the Telegram limit")
+            return None
+        return url
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = executor.map(check, image_urls)
+    return [url for url in results if url]
+
+
+def send_text_message(bot_token, chat_id, text):
+    """Sends a MarkdownV2 text message to a Telegram chat."""
+    telegram_api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    payload = {"chat_id": chat_id, "text": text, "parse_mode": "MarkdownV2"}
+
+    try:
+        response = SESSION.post(telegram_api_url, json=payload, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        logger.info("Message sent successfully!")
+        return True
+    except requests.RequestException as e:
+        logger.error(f"Error sending message: {e}")
+        return False
 
 
-def send_images_with_caption(bot_token, chat_id, image_urls, caption):
+def send_post(bot_token, chat_id, image_urls, caption):
     """
-    Sends multiple images to a Telegram chat with a caption on the first image.
+    Sends the post to a Telegram chat as a single media group with the
+    caption on the first image, falling back to a plain text message when
+    there are no usable images or the caption exceeds Telegram's limit.
     """
+    image_urls = validate_image_urls(image_urls)
     if not image_urls:
-        logger.error("No images to send.")
-        return
+        logger.warning("No images to send, sending text-only message.")
+        return send_text_message(bot_token, chat_id, caption)
+
+    if len(caption) > MAX_CAPTION_LENGTH:
+        # Too long for a media caption; ship the text in its own message
+        if not send_text_message(bot_token, chat_id, caption):
+            return False
+        caption = None
 
     telegram_api_url = f"https://api.telegram.org/bot{bot_token}/sendMediaGroup"
 
     media_group = []
-    for index, img_url in enumerate(image_urls[:MAX_IMAGES_PER_MESSAGE]):  
+    for index, img_url in enumerate(image_urls[:MAX_IMAGES_PER_MESSAGE]):
         media_item = {"type": "photo", "media": img_url}
-        
+
         # Add the caption only to the first image
-        if index == 0:
+        if index == 0 and caption:
             media_item["caption"] = caption
             media_item["parse_mode"] = "MarkdownV2"
-        
+
         media_group.append(media_item)
-    
+
     payload = {"chat_id": chat_id, "media": media_group}
 
     # Send the media group request
     try:
-        requests.post(telegram_api_url, json=payload)
+        response = SESSION.post(telegram_api_url, json=payload, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
         logger.info("Images sent successfully!")
+        return True
     except requests.RequestException as e:
         logger.error(f"Error sending images: {e}")
+        return False
 
 
 def main():
-    xml_content = fetch_rss_content(RSS_FEED_URL)
+    state = load_state()
+
+    xml_content = fetch_rss_content(RSS_FEED_URL, state)
     if not xml_content:
         return
 
@@ -120,11 +247,18 @@ def main():
         logger.error("No post URL found.")
         return
 
-    soup = fetch_post_content(post_url)
-    if not soup:
+    # Skip everything downstream if this post was already sent; the fresh
+    # validators are safe to keep since nothing is pending delivery
+    if post_url == state.get("last_url"):
+        logger.info("Latest post already sent, nothing to do.")
+        save_state(state)
+        return
+
+    tree = fetch_post_content(post_url)
+    if not tree:
         return
 
-    post_title, image_urls = extract_post_data(soup, post_url)
+    post_title, image_urls = extract_post_data(tree, post_url)
 
     logger.debug(f"post_title: {post_title}")
     logger.debug(f"image_urls: {image_urls}")
@@ -134,7 +268,9 @@ def main():
     logger.debug(caption)
     logger.debug(f"# of chars: {len(caption)}")
 
-    send_images_with_caption(BOT_TOKEN, CHAT_ID, image_urls, caption)
+    if send_post(BOT_TOKEN, CHAT_ID, image_urls, caption):
+        state["last_url"] = post_url
+        save_state(state)
 
 
 if __name__ == "__main__":